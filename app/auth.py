@@ -19,30 +19,50 @@ async def get_user_from_bearer(request: Request):
         User dict with claims if token is valid, None otherwise
     """
     auth = request.headers.get("Authorization")
-    if not auth or not auth.lower().startswith("bearer "):
+    # Compare only the scheme prefix instead of lower-casing the whole token
+    if not auth or auth[:7].lower() != "bearer ":
         return None
     
-    token = auth.split(None, 1)[1]
+    token = auth[7:].strip()
+    if not token:
+        return None
     
     try:
         claims = await validate_bearer_token(token)
+        roles = claims.get("realm_access", {}).get("roles", [])
         # Normalize claims into a user-like dict
         return {
             "sub": claims.get("sub"),
             "email": claims.get("email"),
             "preferred_username": claims.get("preferred_username"),
             "name": claims.get("name"),
-            "roles": claims.get("realm_access", {}).get("roles", []),
+            "roles": roles,
             "groups": claims.get("groups", []),
             "claims": claims,
+            # Prebuilt sets so role/scope checks are hash lookups
+            "roles_set": frozenset(roles),
+            "scopes_set": frozenset(claims.get("scope", "").split()),
         }
     except TokenValidationError as e:
-        logger.warning(f"Token validation failed: {e.message}")
+        logger.warning("Token validation failed: %s", e.message)
         return None
     except Exception as e:
         logger.exception("Unexpected error validating bearer token")
         return None
 
+def user_roles(user: dict) -> frozenset:
+    """
+    Realm roles of a user as a set for O(1) membership checks.
+
+    Bearer users carry a prebuilt `roles_set`. Session users only have the
+    `roles` list, since the session cookie is JSON and cannot hold sets.
+    """
+    roles = user.get("roles_set")
+    if roles is None:
+        roles = frozenset(user.get("roles", []))
+    return roles
+
+
 def require_auth(user: dict = Depends(get_user)):
     """Blocks access if user is not logged in."""
     if not user:
@@ -50,9 +70,21 @@ def require_auth(user: dict = Depends(get_user)):
     return user
 
 
-async def require_auth_bearer(session_user: dict = Depends(get_user), bearer_user: dict = Depends(get_user_from_bearer)):
+async def resolve_user(request: Request):
+    """
+    Resolve the caller from the session cookie, falling back to a bearer token.
+    
+    The bearer token is only validated when there is no session user, so
+    browser requests that also send an Authorization header skip it.
+    
+    Returns:
+        User dict, or None if the request is anonymous
+    """
+    return request.session.get('user') or await get_user_from_bearer(request)
+
+
+async def require_auth_bearer(user: dict = Depends(resolve_user)):
     """Composite dependency: accept either session cookie user or validated bearer token."""
-    user = session_user or bearer_user
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     return user
@@ -72,11 +104,10 @@ def require_role(role: str):
         InsufficientPermissionsError: If user lacks required role
     """
     def _require(user: dict = Depends(require_auth_bearer)):
-        roles = user.get("roles", [])
-        if role not in roles:
+        if role not in user_roles(user):
             logger.warning(
                 f"Unauthorized access attempt by {user.get('preferred_username')} "
-                f"for role '{role}'. User roles: {roles}"
+                f"for role '{role}'. User roles: {user.get('roles', [])}"
             )
             raise HTTPException(
                 status_code=403,
@@ -100,13 +131,14 @@ def require_scope(scope: str):
         HTTPException: If user lacks required scope
     """
     def _require(user: dict = Depends(require_auth_bearer)):
-        claims = user.get("claims", {}) or {}
-        token_scope = claims.get("scope", "")
-        scopes = token_scope.split()
+        scopes = user.get("scopes_set")
+        if scopes is None:
+            claims = user.get("claims", {}) or {}
+            scopes = frozenset(claims.get("scope", "").split())
         if scope not in scopes:
             logger.warning(
                 f"Scope '{scope}' required but missing for user "
-                f"{user.get('preferred_username')}. Available scopes: {scopes}"
+                f"{user.get('preferred_username')}. Available scopes: {sorted(scopes)}"
             )
             raise HTTPException(
                 status_code=403,
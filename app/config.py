@@ -1,3 +1,5 @@
+from functools import cached_property
+
 from pydantic_settings import BaseSettings
 from pydantic import field_validator, ValidationInfo
 
@@ -21,18 +23,24 @@ class Settings(BaseSettings):
     # Optional admin client for Keycloak Admin REST API (used for user sync)
     KEYCLOAK_ADMIN_CLIENT_ID: str | None = None
     KEYCLOAK_ADMIN_CLIENT_SECRET: str | None = None
+    # Max concurrent Admin API requests while walking the group hierarchy
+    KEYCLOAK_ADMIN_MAX_CONCURRENCY: int = 32
+    # Page size for Admin API list endpoints (groups, group members)
+    KEYCLOAK_ADMIN_PAGE_SIZE: int = 1000
     
     # Cache TTL Settings (in seconds)
     JWKS_CACHE_TTL: int = 600  # 10 minutes - JWKS keys rarely change
     JWKS_CACHE_MAXSIZE: int = 2  # Small cache, only need current JWKS
+    TOKEN_CACHE_TTL: int = 30  # 30 seconds - validated bearer tokens
+    TOKEN_CACHE_MAXSIZE: int = 4096  # Distinct bearer tokens per worker
     ADMIN_TOKEN_CACHE_TTL: int = 300  # 5 minutes - admin tokens expire quickly
-    ADMIN_TOKEN_CACHE_MAXSIZE: int = 1  # Only one admin token needed
+    ADMIN_TOKEN_CACHE_MAXSIZE: int = 1  # Deprecated, ignored (a single admin token is cached)
     USER_INFO_CACHE_TTL: int = 300  # 5 minutes - user info can change
     USER_INFO_CACHE_MAXSIZE: int = 100  # Cache up to 100 users
     GROUP_CACHE_TTL: int = 600  # 10 minutes - group structure changes infrequently
     GROUP_CACHE_MAXSIZE: int = 50  # Cache up to 50 groups
 
-    @property
+    @cached_property
     def metadata_url(self) -> str:
         if self.KEYCLOAK_METADATA_URL:
             return self.KEYCLOAK_METADATA_URL
@@ -0,0 +1,58 @@
+"""
+Shared HTTP client for outbound calls to Keycloak.
+
+A single httpx.AsyncClient keeps connections to Keycloak alive across
+requests instead of paying a TCP/TLS handshake on every call, and lets
+concurrent calls share connections via HTTP/2 where Keycloak supports it.
+The client is created lazily and closed by the application lifespan.
+"""
+
+import logging
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger("http_client")
+
+_client: Optional[httpx.AsyncClient] = None
+
+# Idle connections are kept this long (httpx defaults to 5s). Kept below
+# the 75s keep-alive timeout of nginx, the usual proxy in front of
+# Keycloak, so the client drops a connection before the server does.
+KEEPALIVE_EXPIRY = 60.0
+
+
+def get_keycloak_client() -> httpx.AsyncClient:
+    """
+    Get the shared Keycloak HTTP client, creating it on first use.
+
+    Returns:
+        Long-lived httpx.AsyncClient with keep-alive enabled
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=10,
+            http2=True,
+            limits=httpx.Limits(
+                max_keepalive_connections=32,
+                max_connections=64,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            headers={"Accept": "application/json"},
+        )
+        logger.info("Keycloak HTTP client created")
+    return _client
+
+
+async def close_keycloak_client() -> None:
+    """
+    Close the shared Keycloak HTTP client.
+
+    Called on application shutdown. Safe to call if the client was never created.
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("Keycloak HTTP client closed")
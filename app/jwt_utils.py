@@ -5,12 +5,19 @@ Provides secure JWT validation using Keycloak's public keys (JWKS).
 Implements TTL-based caching to minimize network calls to Keycloak.
 """
 
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
+import asyncio
+import base64
+import hashlib
 import logging
+import time
 import httpx
-from jose import jwt, JWTError
+import jwt
+import orjson
+from jwt import PyJWK, PyJWTError
 from cachetools import TTLCache
 from .config import settings
+from .http_client import get_keycloak_client
 from .exceptions import TokenValidationError, JWKSFetchError
 
 logger = logging.getLogger("jwt_utils")
@@ -23,12 +30,59 @@ _jwks_cache = TTLCache(
     ttl=settings.JWKS_CACHE_TTL
 )
 
+# Cache claims of successfully validated bearer tokens, keyed by a hash of
+# the token. The same token is sent on every API call during its lifetime,
+# so this skips RSA verification for all but the first request.
+_token_cache = TTLCache(
+    maxsize=settings.TOKEN_CACHE_MAXSIZE,
+    ttl=settings.TOKEN_CACHE_TTL
+)
+
+# Expected "iss" claim for tokens issued by the configured realm
+_ISSUER = f"{settings.KEYCLOAK_SERVER_URL}/realms/{settings.KEYCLOAK_REALM}"
+
+# Signing keys parsed from the currently cached JWKS, keyed by "kid".
+# Stored together with the JWKS dict they were built from so they are
+# rebuilt exactly once whenever the JWKS cache is refreshed.
+_signing_keys: Optional[Tuple[Dict[str, Any], Dict[str, Any]]] = None
+
+# Serializes JWKS refreshes so a burst of requests arriving on a cold or
+# expired cache results in a single round-trip to Keycloak
+_jwks_lock = asyncio.Lock()
+
+
+async def _download_jwks() -> Dict[str, Any]:
+    """
+    Download JWKS from Keycloak (no caching).
+    
+    Returns:
+        Dict containing JWKS keys
+        
+    Raises:
+        JWKSFetchError: If fetching JWKS fails
+    """
+    url = f"{settings.KEYCLOAK_SERVER_URL}/realms/{settings.KEYCLOAK_REALM}/protocol/openid-connect/certs"
+    
+    try:
+        logger.info(f"Fetching JWKS from Keycloak: {url}")
+        r = await get_keycloak_client().get(url)
+        r.raise_for_status()
+        return orjson.loads(r.content)
+    except httpx.HTTPError as e:
+        logger.error(f"Failed to fetch JWKS: {e}")
+        raise JWKSFetchError(f"Failed to fetch JWKS from Keycloak: {str(e)}") from e
+    except Exception as e:
+        logger.exception("Unexpected error fetching JWKS")
+        raise JWKSFetchError(f"Unexpected error fetching JWKS: {str(e)}") from e
+
+
 async def _fetch_jwks() -> Dict[str, Any]:
     """
     Fetch JWKS (JSON Web Key Set) from Keycloak with caching.
     
     JWKS contains public keys used to verify JWT signatures.
     Cached for JWKS_CACHE_TTL seconds (default: 10 minutes).
+    Concurrent cache misses are coalesced into a single fetch.
     
     Returns:
         Dict containing JWKS keys
@@ -43,27 +97,85 @@ async def _fetch_jwks() -> Dict[str, Any]:
         logger.debug("JWKS cache hit")
         return _jwks_cache[key]
     
-    # Fetch from Keycloak
-    url = f"{settings.KEYCLOAK_SERVER_URL}/realms/{settings.KEYCLOAK_REALM}/protocol/openid-connect/certs"
+    async with _jwks_lock:
+        # Another coroutine may have refreshed the cache while we waited
+        if key in _jwks_cache:
+            logger.debug("JWKS cache hit after waiting for refresh")
+            return _jwks_cache[key]
+        
+        jwks = await _download_jwks()
+        
+        # Cache for future requests
+        _jwks_cache[key] = jwks
+        logger.info(f"JWKS cached successfully (TTL: {settings.JWKS_CACHE_TTL}s)")
+        
+        return jwks
+
+def _get_signing_keys(jwks: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Get parsed public keys for a JWKS, keyed by "kid".
     
-    try:
-        logger.info(f"Fetching JWKS from Keycloak: {url}")
-        async with httpx.AsyncClient(timeout=10) as client:
-            r = await client.get(url)
-            r.raise_for_status()
-            jwks = r.json()
-            
-            # Cache for future requests
-            _jwks_cache[key] = jwks
-            logger.info(f"JWKS cached successfully (TTL: {settings.JWKS_CACHE_TTL}s)")
-            
-            return jwks
-    except httpx.HTTPError as e:
-        logger.error(f"Failed to fetch JWKS: {e}")
-        raise JWKSFetchError(f"Failed to fetch JWKS from Keycloak: {str(e)}") from e
-    except Exception as e:
-        logger.exception("Unexpected error fetching JWKS")
-        raise JWKSFetchError(f"Unexpected error fetching JWKS: {str(e)}") from e
+    Parsing a JWK into an RSA public key is expensive, so the parsed keys are
+    memoized for the lifetime of the cached JWKS instead of being rebuilt on
+    every token validation.
+    
+    Args:
+        jwks: JWKS dict as returned by _fetch_jwks
+        
+    Returns:
+        Dict mapping key id to a cryptography public key
+    """
+    global _signing_keys
+    if _signing_keys is not None and _signing_keys[0] is jwks:
+        return _signing_keys[1]
+    
+    keys = {}
+    for key_data in jwks.get("keys", []):
+        # Keycloak also publishes encryption keys; only signing keys matter here
+        if key_data.get("use", "sig") != "sig" or "kid" not in key_data:
+            continue
+        try:
+            keys[key_data["kid"]] = PyJWK(key_data, algorithm="RS256").key
+        except Exception as e:
+            logger.warning(f"Skipping unusable JWK {key_data.get('kid')}: {e}")
+    
+    _signing_keys = (jwks, keys)
+    return keys
+
+
+def _token_digest(token: str) -> bytes:
+    """Fixed-size cache key for a token, so caches never hold raw tokens."""
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def _b64url_decode(segment: str) -> bytes:
+    """Decode an unpadded base64url JWT segment."""
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def decode_jwt_payload(token: str) -> Dict[str, Any]:
+    """
+    Decode JWT payload without verification (for extracting user info).
+    
+    Only for tokens received directly from Keycloak over TLS, such as the
+    authorization code exchange response. Use validate_bearer_token for
+    tokens presented by clients.
+    
+    Args:
+        token: JWT access token
+        
+    Returns:
+        Decoded payload as dictionary
+    """
+    # Slice out just the payload segment rather than splitting the whole token
+    first = token.find('.')
+    last = token.rfind('.')
+    if first == -1 or first == last:
+        raise ValueError("Invalid JWT token format")
+    
+    decoded_bytes = _b64url_decode(token[first + 1:last])
+    return orjson.loads(decoded_bytes)
+
 
 async def validate_bearer_token(token: str, audience: str = None) -> Dict[str, Any]:
     """
@@ -86,10 +198,33 @@ async def validate_bearer_token(token: str, audience: str = None) -> Dict[str, A
         TokenValidationError: If token is invalid or expired
         JWKSFetchError: If JWKS fetching fails
     """
+    cache_key = (_token_digest(token), audience)
+    cached = _token_cache.get(cache_key)
+    if cached is not None and cached.get("exp", 0) > time.time():
+        logger.debug("Validated token cache hit")
+        return cached
+    
     try:
+        # Cheap pre-checks on the unverified token so expired or foreign
+        # tokens are rejected before paying for RSA signature verification.
+        # Signature, exp and iss are still fully verified below.
+        unverified = jwt.decode_complete(token, options={"verify_signature": False})
+        payload = unverified["payload"]
+        # A missing exp is left to the verified decode below
+        if "exp" in payload and payload["exp"] < time.time():
+            raise TokenValidationError("Invalid or expired token: Signature has expired")
+        if payload.get("iss") != _ISSUER:
+            raise TokenValidationError("Invalid or expired token: Invalid issuer")
+        
         # Fetch JWKS (cached)
         jwks = await _fetch_jwks()
         
+        # Pick the pre-parsed key matching the token's "kid"
+        kid = unverified["header"].get("kid")
+        key = _get_signing_keys(jwks).get(kid)
+        if key is None:
+            raise TokenValidationError(f"Unknown signing key: {kid}")
+        
         # Configure validation options
         options = {
             "verify_aud": bool(audience),  # Only verify audience if provided
@@ -100,21 +235,22 @@ async def validate_bearer_token(token: str, audience: str = None) -> Dict[str, A
         # Decode and validate JWT
         claims = jwt.decode(
             token,
-            jwks,
+            key,
             algorithms=["RS256"],  # Keycloak uses RS256 (RSA + SHA256)
             audience=audience,
-            issuer=f"{settings.KEYCLOAK_SERVER_URL}/realms/{settings.KEYCLOAK_REALM}",
+            issuer=_ISSUER,
             options=options,
         )
         
-        logger.debug(f"Token validated successfully for user: {claims.get('preferred_username')}")
+        logger.debug("Token validated successfully for user: %s", claims.get("preferred_username"))
+        _token_cache[cache_key] = claims
         return claims
         
-    except JWTError as e:
-        logger.warning(f"JWT validation error: {e}")
+    except PyJWTError as e:
+        logger.warning("JWT validation error: %s", e)
         raise TokenValidationError(f"Invalid or expired token: {str(e)}") from e
-    except JWKSFetchError:
-        # Re-raise JWKS errors as-is
+    except (JWKSFetchError, TokenValidationError):
+        # Re-raise our own errors as-is
         raise
     except Exception as e:
         logger.exception("Unexpected error validating token")
@@ -123,18 +259,21 @@ async def validate_bearer_token(token: str, audience: str = None) -> Dict[str, A
 
 def clear_jwks_cache() -> None:
     """
-    Clear the JWKS cache.
+    Clear the JWKS cache and the validated token cache.
     
     Useful for testing or when Keycloak keys are rotated.
     Next token validation will fetch fresh JWKS from Keycloak.
     """
+    global _signing_keys
     _jwks_cache.clear()
+    _token_cache.clear()
+    _signing_keys = None
     logger.info("JWKS cache cleared")
 
 
 def get_cache_info() -> Dict[str, Any]:
     """
-    Get JWKS cache statistics.
+    Get JWKS and validated token cache statistics.
     
     Returns:
         Dict with cache size, TTL, and current entries
@@ -143,5 +282,10 @@ def get_cache_info() -> Dict[str, Any]:
         "maxsize": _jwks_cache.maxsize,
         "ttl": _jwks_cache.ttl,
         "current_size": len(_jwks_cache),
-        "keys": list(_jwks_cache.keys())
+        "keys": list(_jwks_cache.keys()),
+        "validated_tokens": {
+            "maxsize": _token_cache.maxsize,
+            "ttl": _token_cache.ttl,
+            "current_size": len(_token_cache),
+        }
     }
@@ -9,47 +9,89 @@ This module mirrors Keycloak's group structure EXACTLY:
 Implements TTL-based caching for admin tokens and group data.
 """
 
+import asyncio
 import logging
-from typing import Dict, List, Any
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
 import httpx
+import orjson
 from cachetools import TTLCache
 
 from .config import settings
+from .http_client import get_keycloak_client
 from .exceptions import KeycloakConnectionError, UserNotFoundError
 
 logger = logging.getLogger("keycloak_admin")
 
-# Cache admin token with configurable TTL
-# Admin tokens are short-lived and used for Keycloak Admin API calls
-_token_cache = TTLCache(
-    maxsize=settings.ADMIN_TOKEN_CACHE_MAXSIZE,
-    ttl=settings.ADMIN_TOKEN_CACHE_TTL
+
+@dataclass(frozen=True)
+class _AdminToken:
+    """
+    Cached admin access token with its expiry on the monotonic clock.
+
+    The Authorization header is built once per token and shared by every
+    Admin API request made with it.
+    """
+    value: str
+    expires_at: float
+    headers: Dict[str, str] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "headers", {"Authorization": f"Bearer {self.value}"})
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+
+# Cache admin token for ADMIN_TOKEN_CACHE_TTL, or less if Keycloak issues
+# shorter-lived tokens. Admin tokens are used for Keycloak Admin API calls.
+_admin_token: Optional[_AdminToken] = None
+
+# Stop using a token this many seconds before Keycloak says it expires, so
+# it cannot expire while a request carrying it is in flight
+ADMIN_TOKEN_EXPIRY_SKEW = 10
+
+# Serializes admin token refreshes so a fan-out over many groups that
+# misses the cache results in a single token request
+_token_lock = asyncio.Lock()
+
+# Cache built group hierarchies with configurable TTL. A build walks the
+# whole realm, so it is shared across requests for the TTL window.
+_group_cache = TTLCache(
+    maxsize=settings.GROUP_CACHE_MAXSIZE,
+    ttl=settings.GROUP_CACHE_TTL
 )
 
+# One lock per cached view so concurrent misses share a single build
+_group_locks = {
+    "hierarchy": asyncio.Lock(),
+    "teams_summary": asyncio.Lock(),
+}
+
+# Background refresher renews the admin token this many seconds before the
+# cached one expires, and retries this often after a failed refresh
+ADMIN_TOKEN_REFRESH_MARGIN = 30
+ADMIN_TOKEN_RETRY_INTERVAL = 10
+
 
 # -------------------------------------------------------------------
 # AUTH
 # -------------------------------------------------------------------
 
-async def get_admin_token() -> str:
+async def _fetch_admin_token() -> _AdminToken:
     """
-    Get admin access token for Keycloak Admin API calls.
+    Request a new admin access token from Keycloak (no caching).
     
     Uses client_credentials grant type with admin client.
-    Token is cached for ADMIN_TOKEN_CACHE_TTL seconds (default: 5 minutes).
     
     Returns:
-        Admin access token string
+        Admin token with its expiry
         
     Raises:
         KeycloakConnectionError: If token fetch fails
     """
-    # Return from cache if available
-    if "admin_token" in _token_cache:
-        logger.debug("Admin token cache hit")
-        return _token_cache["admin_token"]
-
     # Validate admin credentials are configured
     if not settings.KEYCLOAK_ADMIN_CLIENT_ID or not settings.KEYCLOAK_ADMIN_CLIENT_SECRET:
         raise ValueError(
@@ -64,28 +106,32 @@ async def get_admin_token() -> str:
 
     try:
         logger.info("Fetching admin token from Keycloak")
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.post(
-                token_url,
-                data={
-                    "grant_type": "client_credentials",
-                    "client_id": settings.KEYCLOAK_ADMIN_CLIENT_ID,
-                    "client_secret": settings.KEYCLOAK_ADMIN_CLIENT_SECRET,
-                },
-            )
-
-            response.raise_for_status()
-            data = response.json()
+        response = await get_keycloak_client().post(
+            token_url,
+            data={
+                "grant_type": "client_credentials",
+                "client_id": settings.KEYCLOAK_ADMIN_CLIENT_ID,
+                "client_secret": settings.KEYCLOAK_ADMIN_CLIENT_SECRET,
+            },
+        )
 
-            access_token = data.get("access_token")
-            if not access_token:
-                raise ValueError("No access_token received from Keycloak")
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+
+        access_token = data.get("access_token")
+        if not access_token:
+            raise ValueError("No access_token received from Keycloak")
+
+        lifetime = settings.ADMIN_TOKEN_CACHE_TTL
+        expires_in = data.get("expires_in")
+        if expires_in:
+            # The skew would leave very short-lived tokens stale on arrival;
+            # always keep at least half of their lifetime
+            lifetime = min(
+                lifetime, max(expires_in - ADMIN_TOKEN_EXPIRY_SKEW, expires_in / 2)
+            )
 
-            # Cache for future requests
-            _token_cache["admin_token"] = access_token
-            logger.info(f"Admin token cached successfully (TTL: {settings.ADMIN_TOKEN_CACHE_TTL}s)")
-            
-            return access_token
+        return _AdminToken(access_token, time.monotonic() + lifetime)
             
     except httpx.HTTPError as e:
         logger.error(f"Failed to fetch admin token: {e}")
@@ -95,87 +141,286 @@ async def get_admin_token() -> str:
         raise KeycloakConnectionError(f"Unexpected error: {str(e)}") from e
 
 
+async def _get_cached_admin_token() -> _AdminToken:
+    """
+    Get the cached admin token, fetching a new one if it has expired.
+
+    Concurrent cache misses are coalesced into a single token request.
+    """
+    global _admin_token
+
+    # Return from cache if available
+    token = _admin_token
+    if token is not None and token.is_fresh():
+        logger.debug("Admin token cache hit")
+        return token
+
+    async with _token_lock:
+        # Another coroutine may have refreshed the token while we waited
+        token = _admin_token
+        if token is not None and token.is_fresh():
+            logger.debug("Admin token cache hit after waiting for refresh")
+            return token
+
+        token = _admin_token = await _fetch_admin_token()
+        logger.info(
+            f"Admin token cached successfully (TTL: {token.expires_at - time.monotonic():.0f}s)"
+        )
+        
+        return token
+
+
+async def get_admin_token() -> str:
+    """
+    Get admin access token for Keycloak Admin API calls.
+    
+    Token is cached for ADMIN_TOKEN_CACHE_TTL seconds (default: 5 minutes).
+    Concurrent cache misses are coalesced into a single token request.
+    
+    Returns:
+        Admin access token string
+        
+    Raises:
+        KeycloakConnectionError: If token fetch fails
+    """
+    return (await _get_cached_admin_token()).value
+
+
+async def run_admin_token_refresher() -> None:
+    """
+    Keep the cached admin token fresh in the background.
+
+    Fetches a token immediately, then renews it ADMIN_TOKEN_REFRESH_MARGIN
+    seconds before the cached one expires, so request handlers never
+    wait on a token refresh at the expiry boundary. Runs until cancelled;
+    foreground misses still go through get_admin_token if a refresh fails.
+    """
+    global _admin_token
+
+    while True:
+        try:
+            async with _token_lock:
+                token = _admin_token = await _fetch_admin_token()
+            logger.debug("Admin token refreshed in background")
+            delay = max(
+                token.expires_at - time.monotonic() - ADMIN_TOKEN_REFRESH_MARGIN,
+                ADMIN_TOKEN_RETRY_INTERVAL,
+            )
+        except Exception:
+            logger.warning(
+                "Background admin token refresh failed, retrying in %ss",
+                ADMIN_TOKEN_RETRY_INTERVAL,
+            )
+            delay = ADMIN_TOKEN_RETRY_INTERVAL
+        await asyncio.sleep(delay)
+
+
 # -------------------------------------------------------------------
 # RAW KEYCLOAK CALLS
 # -------------------------------------------------------------------
 
-async def get_groups() -> List[Dict[str, Any]]:
+# Whether Keycloak serves /groups/{id}/children; None until first probed
+_children_endpoint: Optional[bool] = None
+
+# Caps concurrent Admin API requests so hierarchy fan-out cannot overwhelm
+# Keycloak or exhaust the shared connection pool
+_admin_semaphore = asyncio.Semaphore(settings.KEYCLOAK_ADMIN_MAX_CONCURRENCY)
+
+
+async def _admin_get(path: str, params: Optional[Dict[str, Any]] = None) -> Any:
     """
-    Fetch TOP-LEVEL groups only (Keycloak behavior).
+    GET an Admin API resource for the configured realm.
+
+    Args:
+        path: Path relative to /admin/realms/{realm}, e.g. "/groups"
+        params: Optional query parameters
+
+    Returns:
+        Decoded JSON response body
     """
-    token = await get_admin_token()
+    # The admin token stays off the shared client, which also serves
+    # unauthenticated OIDC calls; each token carries its own header dict
+    token = await _get_cached_admin_token()
 
-    url = f"{settings.KEYCLOAK_SERVER_URL}/admin/realms/{settings.KEYCLOAK_REALM}/groups"
-    headers = {"Authorization": f"Bearer {token}"}
+    url = f"{settings.KEYCLOAK_SERVER_URL}/admin/realms/{settings.KEYCLOAK_REALM}{path}"
+
+    async with _admin_semaphore:
+        response = await get_keycloak_client().get(url, headers=token.headers, params=params)
+    response.raise_for_status()
+    return orjson.loads(response.content)
 
-    async with httpx.AsyncClient(timeout=10) as client:
-        response = await client.get(url, headers=headers)
-        response.raise_for_status()
-        return response.json()
 
+def _page_params(first: int, max_results: int) -> Dict[str, Any]:
+    """Query parameters for one page of a brief Admin API listing."""
+    return {"briefRepresentation": "true", "first": first, "max": max_results}
 
-async def get_group_members(group_id: str) -> List[Dict[str, Any]]:
+
+async def _admin_get_all(path: str, first: int = 0) -> List[Dict[str, Any]]:
     """
-    Fetch DIRECT members of a group.
-    Does NOT include subgroup users.
+    GET every item of a paginated Admin API collection.
+
+    Requests brief representations and pages with first/max. Keycloak
+    silently caps unpaginated list endpoints (100 members by default), so
+    paging is required for completeness; with KEYCLOAK_ADMIN_PAGE_SIZE
+    large enough the common case is still a single request.
+
+    Args:
+        path: Collection path relative to /admin/realms/{realm}
+        first: Offset of the first item to return
+
+    Returns:
+        All items of the collection from `first` onwards
     """
-    token = await get_admin_token()
+    page_size = settings.KEYCLOAK_ADMIN_PAGE_SIZE
+    items: List[Dict[str, Any]] = []
 
-    url = (
-        f"{settings.KEYCLOAK_SERVER_URL}"
-        f"/admin/realms/{settings.KEYCLOAK_REALM}"
-        f"/groups/{group_id}/members"
-    )
-    headers = {"Authorization": f"Bearer {token}"}
+    while True:
+        page = await _admin_get(path, params=_page_params(first, page_size))
+        items.extend(page)
+        if len(page) < page_size:
+            return items
+        first += page_size
 
-    async with httpx.AsyncClient(timeout=10) as client:
-        response = await client.get(url, headers=headers)
-        response.raise_for_status()
-        return response.json()
+
+async def get_groups(first: int = 0, max_results: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Fetch TOP-LEVEL groups only (Keycloak behavior).
+
+    Returns all groups unless max_results is given.
+    """
+    if max_results is None:
+        return await _admin_get_all("/groups", first)
+    return await _admin_get("/groups", params=_page_params(first, max_results))
+
+
+async def get_group_members(
+    group_id: str, first: int = 0, max_results: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Fetch DIRECT members of a group.
+    Does NOT include subgroup users.
+
+    Returns all members unless max_results is given.
+    """
+    path = f"/groups/{group_id}/members"
+    if max_results is None:
+        return await _admin_get_all(path, first)
+    return await _admin_get(path, params=_page_params(first, max_results))
 
 
 async def get_subgroups(group_id: str) -> List[Dict[str, Any]]:
     """
     Fetch sub-groups of a group.
+
+    Uses the paginated /groups/{id}/children endpoint (Keycloak 23+), which
+    returns brief child representations only. Older servers answer a GET
+    there with 404 or 405. Since a group deleted in the meantime also
+    gives 404, the endpoint is only considered missing once the group
+    itself is confirmed to exist; from then on `subGroups` is read from
+    the full group representation for the rest of the process lifetime.
     """
-    token = await get_admin_token()
+    global _children_endpoint
 
-    url = (
-        f"{settings.KEYCLOAK_SERVER_URL}"
-        f"/admin/realms/{settings.KEYCLOAK_REALM}"
-        f"/groups/{group_id}"
-    )
-    headers = {"Authorization": f"Bearer {token}"}
+    if _children_endpoint is False:
+        group = await _admin_get(f"/groups/{group_id}")
+        return group.get("subGroups", [])
 
-    async with httpx.AsyncClient(timeout=10) as client:
-        response = await client.get(url, headers=headers)
-        response.raise_for_status()
-        return response.json().get("subGroups", [])
+    try:
+        children = await _admin_get_all(f"/groups/{group_id}/children")
+    except httpx.HTTPStatusError as e:
+        # Once the endpoint is known to exist, errors are about the group
+        if e.response.status_code not in (404, 405) or _children_endpoint:
+            raise
+        # Raises (leaving the endpoint unprobed) if the group is gone
+        group = await _admin_get(f"/groups/{group_id}")
+        _children_endpoint = False
+        logger.info("Keycloak has no group children endpoint, using group lookups")
+        return group.get("subGroups", [])
+
+    _children_endpoint = True
+    return children
 
 
 # -------------------------------------------------------------------
 # HIERARCHY BUILDER (CORE LOGIC)
 # -------------------------------------------------------------------
 
-async def build_group_tree(group: Dict[str, Any]) -> Dict[str, Any]:
+async def _resolve_subgroups(group: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
-    Recursively build group hierarchy EXACTLY like Keycloak UI.
+    Sub-groups of a group, reusing the ones embedded in its representation.
+
+    Keycloak before 23 embeds the whole tree in `subGroups` of the /groups
+    listing; newer releases send an empty `subGroups` alongside the real
+    `subGroupCount`. Embedded sub-groups are trusted when no count is given
+    or the count matches, so only groups with unlisted children cost a
+    request (leaf groups reported by the children endpoint cost none).
+    """
+    subgroups = group.get("subGroups")
+    if subgroups is not None:
+        count = group.get("subGroupCount")
+        if count is None or count == len(subgroups):
+            return subgroups
+    return await get_subgroups(group["id"])
+
+
+async def _build_group_forest(
+    top_groups: List[Dict[str, Any]],
+    fetch_members: Callable[[str], Awaitable[List[Dict[str, Any]]]],
+    make_node: Callable[[Dict[str, Any], List[Dict[str, Any]], List[Dict[str, Any]]], Dict[str, Any]],
+) -> List[Dict[str, Any]]:
     """
+    Build group trees level by level (breadth-first).
+
+    Members and sub-groups of every group on a level are fetched in one
+    concurrent batch (sub-groups already embedded in a representation are
+    reused), and the sub-groups found become the next level. Once all
+    levels are resolved, nodes are assembled bottom-up so each parent
+    can reference its finished children.
+
+    Args:
+        top_groups: Roots of the trees to build
+        fetch_members: Coroutine returning the direct members of a group id
+        make_node: Builds a node from (group, members, child nodes)
 
-    group_id = group["id"]
+    Returns:
+        One node per top-level group, in the order given
+    """
+    levels: List[List[Tuple[Dict[str, Any], List[Dict[str, Any]], List[Dict[str, Any]]]]] = []
+    seen = set()
+    level = top_groups
+
+    while level:
+        # Each group is fetched once even if listed under several parents
+        pending = []
+        for group in level:
+            if group["id"] not in seen:
+                seen.add(group["id"])
+                pending.append(group)
+
+        results = await asyncio.gather(
+            *(
+                asyncio.gather(fetch_members(g["id"]), _resolve_subgroups(g))
+                for g in pending
+            )
+        )
+        levels.append([(g, members, subgroups) for g, (members, subgroups) in zip(pending, results)])
+        level = [sg for _, _, subgroups in levels[-1] for sg in subgroups]
 
-    # Direct members only (truth)
-    members = await get_group_members(group_id)
+    nodes: Dict[str, Dict[str, Any]] = {}
+    for entries in reversed(levels):
+        for group, members, subgroups in entries:
+            children = [nodes[sg["id"]] for sg in subgroups if sg["id"] in nodes]
+            nodes[group["id"]] = make_node(group, members, children)
 
-    # Child groups
-    subgroups = await get_subgroups(group_id)
+    return [nodes[g["id"]] for g in top_groups]
 
-    children = []
-    for sg in subgroups:
-        children.append(await build_group_tree(sg))
 
+def _hierarchy_node(
+    group: Dict[str, Any], members: List[Dict[str, Any]], children: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Shape a node EXACTLY like the Keycloak UI tree."""
     return {
-        "id": group_id,
+        "id": group["id"],
         "name": group["name"],
         "path": group.get("path", ""),
         "members": members,
@@ -183,23 +428,86 @@ async def build_group_tree(group: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+async def _members_or_empty(group_id: str, failed: List[str]) -> List[Dict[str, Any]]:
+    """
+    Direct members of a group, or an empty list if they cannot be read.
+
+    The id of a group whose members could not be read is appended to
+    `failed`, so the caller can tell a partial build from a complete one.
+    """
+    try:
+        return await get_group_members(group_id)
+    except Exception as e:
+        logger.warning(f"Failed to fetch members of group {group_id}: {e}")
+        failed.append(group_id)
+        return []
+
+
+def _full_group_node(
+    group: Dict[str, Any], members: List[Dict[str, Any]], children: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Shape a node for get_groups_with_members, including its sub-group count."""
+    return {
+        "id": group.get("id"),
+        "name": group.get("name"),
+        "path": group.get("path", ""),
+        "subGroupCount": len(children),
+        "members": members,
+        "subGroups": children,
+    }
+
+
 # -------------------------------------------------------------------
 # PUBLIC API
 # -------------------------------------------------------------------
 
+async def _cached_group_data(
+    key: str, build: Callable[[], Awaitable[Tuple[Any, bool]]]
+) -> Any:
+    """
+    Return cached group data, building it at most once per TTL window.
+
+    Concurrent callers that miss the cache wait for a single build instead
+    of each walking the whole realm. Callers must not mutate the result.
+
+    Args:
+        key: Cache key of the view
+        build: Coroutine returning (data, complete). Incomplete data (some
+            lookups failed) is returned to the waiting callers but not
+            cached, so the next request retries instead of serving the
+            gaps for a whole TTL window.
+    """
+    if key in _group_cache:
+        logger.debug("Group cache hit: %s", key)
+        return _group_cache[key]
+
+    async with _group_locks[key]:
+        # Another coroutine may have built the data while we waited
+        if key in _group_cache:
+            return _group_cache[key]
+
+        data, complete = await build()
+        if not complete:
+            logger.warning(f"Group data '{key}' is incomplete, not caching it")
+            return data
+        _group_cache[key] = data
+        logger.info(f"Group data '{key}' cached (TTL: {settings.GROUP_CACHE_TTL}s)")
+        return data
+
+
 async def get_group_hierarchy() -> List[Dict[str, Any]]:
     """
     Entry point.
     Returns full Keycloak org structure with members.
+    Cached for GROUP_CACHE_TTL seconds (default: 10 minutes).
     """
+    return await _cached_group_data("hierarchy", _build_group_hierarchy)
 
-    top_groups = await get_groups()
-    hierarchy = []
-
-    for group in top_groups:
-        hierarchy.append(await build_group_tree(group))
 
-    return hierarchy
+async def _build_group_hierarchy() -> Tuple[List[Dict[str, Any]], bool]:
+    # Lookup errors propagate, so a built hierarchy is always complete
+    top_groups = await get_groups()
+    return await _build_group_forest(top_groups, get_group_members, _hierarchy_node), True
 
 
 async def get_groups_with_members() -> List[Dict[str, Any]]:
@@ -212,34 +520,48 @@ async def get_groups_with_members() -> List[Dict[str, Any]]:
       - subGroupCount: number of immediate subgroups
 
     This mirrors the previous `get_groups_with_members` shape used by routes.
+    Served from the get_teams_summary cache entry.
     """
+    return (await get_teams_summary())["teams"]
+
+
+async def _build_groups_with_members() -> Tuple[List[Dict[str, Any]], bool]:
     top_groups = await get_groups()
-    result: List[Dict[str, Any]] = []
+    failed: List[str] = []
+    teams = await _build_group_forest(
+        top_groups, lambda group_id: _members_or_empty(group_id, failed), _full_group_node
+    )
+    return teams, not failed
 
-    async def build_full_group(g: Dict[str, Any]) -> Dict[str, Any]:
-        group_id = g["id"]
-        try:
-            members = await get_group_members(group_id)
-        except Exception:
-            members = []
-
-        # Recursively fetch subgroups
-        subgroups = await get_subgroups(group_id)
-        children = [await build_full_group(sg) for sg in subgroups]
-
-        return {
-            "id": g.get("id"),
-            "name": g.get("name"),
-            "path": g.get("path", ""),
-            "subGroupCount": len(children),
-            "members": members,
-            "subGroups": children,
-        }
 
-    for g in top_groups:
-        result.append(await build_full_group(g))
+async def get_teams_summary() -> Dict[str, Any]:
+    """
+    Top-level teams together with their precomputed totals.
+
+    The totals are computed in the same build as the team list and cached
+    with it, so they can never be older than the teams themselves.
 
-    return result
+    Returns:
+        Dict with "teams" (as from get_groups_with_members), "totalTeams"
+        and "totalEmployees" (direct members of the top-level groups).
+        Cached for GROUP_CACHE_TTL seconds (default: 10 minutes).
+    """
+    return await _cached_group_data("teams_summary", _build_teams_summary)
+
+
+async def _build_teams_summary() -> Tuple[Dict[str, Any], bool]:
+    teams, complete = await _build_groups_with_members()
+    total_employees = 0
+    for team in teams:
+        members = team.get("members")
+        if members:
+            total_employees += len(members)
+    summary = {
+        "teams": teams,
+        "totalTeams": len(teams),
+        "totalEmployees": total_employees,
+    }
+    return summary, complete
 
 
 # -------------------------------------------------------------------
@@ -253,10 +575,22 @@ def clear_admin_token_cache() -> None:
     Forces a fresh token fetch on next admin API call.
     Useful for testing or when admin credentials change.
     """
-    _token_cache.clear()
+    global _admin_token
+    _admin_token = None
     logger.info("Admin token cache cleared")
 
 
+def clear_group_cache() -> None:
+    """
+    Clear the group hierarchy cache.
+    
+    Forces a fresh walk of the realm on the next hierarchy request.
+    Useful after changing groups or memberships in Keycloak.
+    """
+    _group_cache.clear()
+    logger.info("Group cache cleared")
+
+
 def get_cache_info() -> Dict[str, Any]:
     """
     Get cache statistics for monitoring.
@@ -264,11 +598,18 @@ def get_cache_info() -> Dict[str, Any]:
     Returns:
         Dict with cache configuration and current state
     """
+    has_token = _admin_token is not None and _admin_token.is_fresh()
     return {
         "admin_token_cache": {
-            "maxsize": _token_cache.maxsize,
-            "ttl": _token_cache.ttl,
-            "current_size": len(_token_cache),
-            "keys": list(_token_cache.keys())
+            "maxsize": 1,
+            "ttl": settings.ADMIN_TOKEN_CACHE_TTL,
+            "current_size": int(has_token),
+            "keys": ["admin_token"] if has_token else [],
+        },
+        "group_cache": {
+            "maxsize": _group_cache.maxsize,
+            "ttl": _group_cache.ttl,
+            "current_size": len(_group_cache),
+            "keys": list(_group_cache.keys())
         }
     }
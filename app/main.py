@@ -1,14 +1,42 @@
+import asyncio
 import logging
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from .config import settings
+from .http_client import close_keycloak_client, get_keycloak_client
+from .keycloak_admin import run_admin_token_refresher
 from .routes import router
 
 # Configure logging for production
 logging.basicConfig(level=logging.INFO)
 
-app = FastAPI(title="Keycloak Auth Service")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Set up shared resources on startup and release them on shutdown.
+
+    Creates the Keycloak connection pool and, when admin credentials are
+    configured, starts the background admin token refresher.
+    """
+    get_keycloak_client()
+    refresher = None
+    if settings.KEYCLOAK_ADMIN_CLIENT_ID and settings.KEYCLOAK_ADMIN_CLIENT_SECRET:
+        refresher = asyncio.create_task(run_admin_token_refresher())
+
+    yield
+
+    if refresher is not None:
+        refresher.cancel()
+        with suppress(asyncio.CancelledError):
+            await refresher
+    await close_keycloak_client()
+
+
+app = FastAPI(title="Keycloak Auth Service", lifespan=lifespan)
 
 # CORS Configuration: Allow frontend to call auth endpoints
 # In development, allow all origins; in production, specify exact frontend origin
@@ -26,6 +54,10 @@ app.add_middleware(
     allow_headers=["Authorization", "Content-Type"],
 )
 
+# Compress larger JSON payloads (e.g. team listings); small responses are
+# sent as-is since gzip overhead outweighs the savings below ~1 KB
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Security: Ensure cookies are Secure (HTTPS only) in production
 is_production = settings.ENV == "prod"
 
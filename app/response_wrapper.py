@@ -4,10 +4,75 @@ Response wrapper for consistent API responses across all endpoints.
 Provides standardized success and error response formats with metadata including TTL.
 """
 
-from typing import Any, Optional, Dict
-from datetime import datetime, timedelta
-from fastapi import status
-from fastapi.responses import JSONResponse
+import hashlib
+import time
+from typing import Any, Optional, Dict, Tuple
+import orjson
+from fastapi import Request, status
+from fastapi.responses import JSONResponse, Response
+
+API_VERSION = "1.0"
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSONResponse serialized with orjson.
+
+    orjson is several times faster than the stdlib encoder on large nested
+    payloads such as the team hierarchy. Only for handlers that return a
+    response themselves (APIResponse, cached_response, /ceo): it is not the
+    app default, since a custom default response class makes FastAPI skip
+    its Pydantic serialization fast path for annotated routes.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+# Timestamps have one-second resolution, so the formatted string is reused
+# for every response within the same second.
+_timestamp_second = -1
+_timestamp_iso = ""
+
+
+def _format_utc(epoch_seconds: int) -> str:
+    """Format epoch seconds as an ISO-8601 UTC string."""
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(epoch_seconds))
+
+
+def _utc_now() -> Tuple[int, str]:
+    """
+    Get the current UTC time, cached per second.
+
+    Returns:
+        Tuple of (epoch seconds, ISO-8601 string)
+    """
+    global _timestamp_second, _timestamp_iso
+    now = int(time.time())
+    if now != _timestamp_second:
+        _timestamp_iso = _format_utc(now)
+        _timestamp_second = now
+    return now, _timestamp_iso
+
+
+def _base_metadata(ttl: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Build the common response metadata, with TTL details if provided.
+
+    Args:
+        ttl: Time-to-live in seconds (optional)
+    """
+    now, timestamp = _utc_now()
+    metadata: Dict[str, Any] = {"timestamp": timestamp, "version": API_VERSION}
+
+    if ttl is not None:
+        metadata["ttl"] = {
+            "value": ttl,
+            "unit": "seconds",
+            "expires_at": _format_utc(now + ttl),
+            "human_readable": f"{ttl // 60} minutes" if ttl >= 60 else f"{ttl} seconds"
+        }
+
+    return metadata
 
 
 class APIResponse:
@@ -52,20 +117,7 @@ class APIResponse:
         Returns:
             JSONResponse with standardized success format including TTL
         """
-        base_metadata = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
-            "version": "1.0",
-        }
-        
-        # Add TTL information if provided
-        if ttl is not None:
-            expires_at = datetime.utcnow() + timedelta(seconds=ttl)
-            base_metadata["ttl"] = {
-                "value": ttl,
-                "unit": "seconds",
-                "expires_at": expires_at.isoformat() + "Z",
-                "human_readable": f"{ttl // 60} minutes" if ttl >= 60 else f"{ttl} seconds"
-            }
+        base_metadata = _base_metadata(ttl)
         
         # Merge with additional metadata
         if metadata:
@@ -78,7 +130,7 @@ class APIResponse:
             "metadata": base_metadata
         }
         
-        return JSONResponse(
+        return ORJSONResponse(
             content=response_data,
             status_code=status_code
         )
@@ -112,13 +164,13 @@ class APIResponse:
                 "details": details
             },
             "metadata": {
-                "timestamp": datetime.utcnow().isoformat() + "Z",
-                "version": "1.0",
+                "timestamp": _utc_now()[1],
+                "version": API_VERSION,
                 **(metadata or {})
             }
         }
         
-        return JSONResponse(
+        return ORJSONResponse(
             content=response_data,
             status_code=status_code
         )
@@ -192,24 +244,66 @@ def wrap_response(
     Usage:
         return wrap_response({"user": user_data}, "User fetched successfully", ttl=300)
     """
-    base_metadata = {
-        "timestamp": datetime.utcnow().isoformat() + "Z",
-        "version": "1.0"
-    }
-    
-    # Add TTL information if provided
-    if ttl is not None:
-        expires_at = datetime.utcnow() + timedelta(seconds=ttl)
-        base_metadata["ttl"] = {
-            "value": ttl,
-            "unit": "seconds",
-            "expires_at": expires_at.isoformat() + "Z",
-            "human_readable": f"{ttl // 60} minutes" if ttl >= 60 else f"{ttl} seconds"
-        }
-    
     return {
         "success": True,
         "message": message,
         "data": data,
-        "metadata": base_metadata
+        "metadata": _base_metadata(ttl)
     }
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def cached_response(
+    request: Request,
+    data: Any,
+    message: str = "Success",
+    ttl: int = 60,
+    store: bool = True
+) -> Response:
+    """
+    Wrapped response with ETag revalidation for per-user data.
+    
+    The ETag is derived from the payload only, not the envelope metadata
+    (whose timestamp changes every second), so clients revalidating with
+    If-None-Match get an empty 304 while the data is unchanged. Browsers
+    may keep the response but must revalidate it on every use, so a
+    logout, a user switch or a cache clear is never hidden behind a stale
+    copy; Vary keeps copies for different sessions and tokens apart.
+    
+    Args:
+        request: Incoming request (for If-None-Match)
+        data: Response payload
+        message: Success message
+        ttl: Lifetime reported in the envelope metadata
+        store: False for payloads carrying secrets such as tokens; these
+            are sent with no-store and without an ETag
+    
+    Usage:
+        return cached_response(request, user_data, "User fetched", ttl=300)
+    """
+    headers = {"Vary": "Cookie, Authorization"}
+    if not store:
+        headers["Cache-Control"] = "no-store"
+        return ORJSONResponse(content=wrap_response(data, message, ttl=ttl), headers=headers)
+    
+    digest = hashlib.blake2b(orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS), digest_size=16)
+    # Weak: the tag covers the data, and GZipMiddleware may serve it as
+    # either a gzip or an identity representation
+    etag = f'W/"{digest.hexdigest()}"'
+    headers["ETag"] = etag
+    headers["Cache-Control"] = "private, no-cache"
+    
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    return ORJSONResponse(content=wrap_response(data, message, ttl=ttl), headers=headers)
@@ -1,44 +1,76 @@
-import json
-import base64
+import html
 import secrets
 from typing import Dict, Any
+from urllib.parse import urlencode
 
+import orjson
 from fastapi import APIRouter, Request, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from fastapi.exceptions import HTTPException
-import httpx
 
 from .auth import require_manager, require_ceo, require_role, require_auth_bearer
 from .config import settings
-from .keycloak_admin import get_groups_with_members
-from .response_wrapper import wrap_response
+from .http_client import get_keycloak_client
+from .jwt_utils import clear_jwks_cache, decode_jwt_payload
+from .jwt_utils import get_cache_info as get_jwt_cache_info
+from .keycloak_admin import clear_admin_token_cache, clear_group_cache, get_teams_summary
+from .keycloak_admin import get_cache_info as get_admin_cache_info
+from .response_wrapper import ORJSONResponse, cached_response, wrap_response
 
 router = APIRouter()
 
+# Keycloak OIDC endpoints for the configured realm (settings are fixed at startup)
+_OIDC_BASE_URL = (
+    f"{settings.KEYCLOAK_SERVER_URL}/realms/{settings.KEYCLOAK_REALM}/protocol/openid-connect"
+)
+_AUTH_URL = f"{_OIDC_BASE_URL}/auth"
+_TOKEN_URL = f"{_OIDC_BASE_URL}/token"
+
+# Authorization request with the fixed parameters already encoded; login
+# appends only the per-request redirect_uri and state
+_AUTH_URL_PREFIX = f"{_AUTH_URL}?" + urlencode({
+    "client_id": settings.KEYCLOAK_CLIENT_ID,
+    "response_type": "code",
+    "scope": "openid email profile",
+})
+
+# Logout request with client_id already encoded; logout appends only the
+# per-request post_logout_redirect_uri
+_LOGOUT_URL_PREFIX = f"{_OIDC_BASE_URL}/logout?" + urlencode({
+    "client_id": settings.KEYCLOAK_CLIENT_ID,
+})
+
+# Path Keycloak redirects back to after login (must match the client config)
+_CALLBACK_PATH = "/callback"
+
+# TTLs reported by /cache/info and /cache/clear. Settings are fixed at
+# startup, so these are built once; handlers must not mutate them.
+_CACHE_TTL_CONFIG = {
+    "jwks_ttl": settings.JWKS_CACHE_TTL,
+    "jwks_ttl_human": f"{settings.JWKS_CACHE_TTL // 60} minutes",
+    "admin_token_ttl": settings.ADMIN_TOKEN_CACHE_TTL,
+    "admin_token_ttl_human": f"{settings.ADMIN_TOKEN_CACHE_TTL // 60} minutes",
+    "user_info_ttl": settings.USER_INFO_CACHE_TTL,
+    "user_info_ttl_human": f"{settings.USER_INFO_CACHE_TTL // 60} minutes",
+    "group_ttl": settings.GROUP_CACHE_TTL,
+    "group_ttl_human": f"{settings.GROUP_CACHE_TTL // 60} minutes",
+}
+_CLEARED_CACHE_TTL = {
+    "jwks": f"{settings.JWKS_CACHE_TTL}s ({settings.JWKS_CACHE_TTL // 60}min)",
+    "admin_token": f"{settings.ADMIN_TOKEN_CACHE_TTL}s ({settings.ADMIN_TOKEN_CACHE_TTL // 60}min)",
+    "groups": f"{settings.GROUP_CACHE_TTL}s ({settings.GROUP_CACHE_TTL // 60}min)",
+}
+
 
 # Helper Functions
-def decode_jwt_payload(token: str) -> Dict[str, Any]:
+def _callback_url(request: Request) -> str:
     """
-    Decode JWT payload without verification (for extracting user info).
+    Absolute URL of the OAuth callback for this request's host.
     
-    Args:
-        token: JWT access token
-        
-    Returns:
-        Decoded payload as dictionary
+    Built from the request base URL instead of url_for, which searches the
+    route table on every call.
     """
-    parts = token.split('.')
-    if len(parts) != 3:
-        raise ValueError("Invalid JWT token format")
-    
-    # Decode payload (add padding if needed)
-    payload = parts[1]
-    padding = 4 - len(payload) % 4
-    if padding != 4:
-        payload += '=' * padding
-    
-    decoded_bytes = base64.urlsafe_b64decode(payload)
-    return json.loads(decoded_bytes)
+    return f"{str(request.base_url).rstrip('/')}{_CALLBACK_PATH}"
 
 
 async def exchange_code_for_tokens(code: str, redirect_uri: str) -> Dict[str, Any]:
@@ -55,19 +87,16 @@ async def exchange_code_for_tokens(code: str, redirect_uri: str) -> Dict[str, An
     Raises:
         HTTPException: If token exchange fails
     """
-    token_url = f"{settings.KEYCLOAK_SERVER_URL}/realms/{settings.KEYCLOAK_REALM}/protocol/openid-connect/token"
-    
-    async with httpx.AsyncClient(timeout=10) as client:
-        response = await client.post(
-            token_url,
-            data={
-                'grant_type': 'authorization_code',
-                'client_id': settings.KEYCLOAK_CLIENT_ID,
-                'client_secret': settings.KEYCLOAK_CLIENT_SECRET,
-                'code': code,
-                'redirect_uri': redirect_uri,
-            }
-        )
+    response = await get_keycloak_client().post(
+        _TOKEN_URL,
+        data={
+            'grant_type': 'authorization_code',
+            'client_id': settings.KEYCLOAK_CLIENT_ID,
+            'client_secret': settings.KEYCLOAK_CLIENT_SECRET,
+            'code': code,
+            'redirect_uri': redirect_uri,
+        }
+    )
     
     if response.status_code != 200:
         raise HTTPException(
@@ -75,7 +104,7 @@ async def exchange_code_for_tokens(code: str, redirect_uri: str) -> Dict[str, An
             detail=f"Token exchange failed: {response.text}"
         )
     
-    return response.json()
+    return orjson.loads(response.content)
 
 
 def extract_user_info(token_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -108,6 +137,31 @@ def extract_user_info(token_data: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+# Homepage markup is fixed; only user fields are filled in per request
+_LOGIN_PAGE = b'<a href="/login">Login with Keycloak</a>'
+_HOME_PREFIX = b"\n        <h1>Welcome, "
+_HOME_ROLES = b"</h1>\n        <p>Roles: "
+_HOME_MENU = b"</p>\n        <ul>"
+_HOME_END = b"</ul>\n    "
+
+# Every possible dashboard menu, indexed by a role bitmask
+# (bit 0: manager, bit 1: ceo); the logout link always comes last
+_MANAGER_MENU_ITEM = b'<li><a href="/manager">Manager Dashboard</a></li>'
+_CEO_MENU_ITEM = b'<li><a href="/ceo">CEO Dashboard</a></li>'
+_LOGOUT_MENU_ITEM = b'<li><a href="/logout">Logout</a></li>'
+_MENU_TABLE = (
+    _LOGOUT_MENU_ITEM,
+    _MANAGER_MENU_ITEM + _LOGOUT_MENU_ITEM,
+    _CEO_MENU_ITEM + _LOGOUT_MENU_ITEM,
+    _MANAGER_MENU_ITEM + _CEO_MENU_ITEM + _LOGOUT_MENU_ITEM,
+)
+
+_MANAGER_PAGE = b"<h1>Manager Dashboard</h1><p>Welcome, Manager!</p>"
+
+# Pre-encoded body for the liveness probe, hit every few seconds
+_HEALTH_BODY = b'{"status":"ok"}'
+
+
 # Routes
 @router.get("/", response_class=HTMLResponse)
 async def homepage(request: Request) -> HTMLResponse:
@@ -115,48 +169,40 @@ async def homepage(request: Request) -> HTMLResponse:
     user = request.session.get("user")
 
     if not user:
-        return HTMLResponse('<a href="/login">Login with Keycloak</a>')
+        return HTMLResponse(_LOGIN_PAGE)
 
     roles = user.get("roles", [])
     name = user.get("preferred_username") or user.get("email") or "User"
 
-    menu_items = []
-    if "manager" in roles:
-        menu_items.append('<li><a href="/manager">Manager Dashboard</a></li>')
-    if "ceo" in roles:
-        menu_items.append('<li><a href="/ceo">CEO Dashboard</a></li>')
-    
-    menu_items.append('<li><a href="/logout">Logout</a></li>')
+    # Session users only carry the roles list (the cookie is JSON); two
+    # scans of a short list are cheaper than building a set per request
+    menu = _MENU_TABLE[("manager" in roles) | ("ceo" in roles) << 1]
 
-    return HTMLResponse(f"""
-        <h1>Welcome, {name}</h1>
-        <p>Roles: {roles}</p>
-        <ul>{''.join(menu_items)}</ul>
-    """)
+    # User fields come from the identity provider; escape them before
+    # splicing into markup
+    return HTMLResponse(b"".join((
+        _HOME_PREFIX, html.escape(name).encode(),
+        _HOME_ROLES, html.escape(str(roles)).encode(),
+        _HOME_MENU, menu, _HOME_END,
+    )))
 
 
 
 @router.get("/login")
 async def login(request: Request) -> RedirectResponse:
     """Redirect to Keycloak login page."""
-    redirect_uri = str(request.url_for('auth_callback'))
-    state = secrets.token_urlsafe(32)
+    redirect_uri = _callback_url(request)
+    # 24 random bytes (192 bits) is ample for CSRF state and keeps the cookie small
+    state = secrets.token_urlsafe(24)
     request.session['oauth_state'] = state
     
-    auth_url = (
-        f"{settings.KEYCLOAK_SERVER_URL}/realms/{settings.KEYCLOAK_REALM}"
-        f"/protocol/openid-connect/auth"
-        f"?client_id={settings.KEYCLOAK_CLIENT_ID}"
-        f"&redirect_uri={redirect_uri}"
-        f"&response_type=code"
-        f"&scope=openid%20email%20profile"
-        f"&state={state}"
-    )
+    query = urlencode({"redirect_uri": redirect_uri, "state": state})
+    auth_url = f"{_AUTH_URL_PREFIX}&{query}"
     
     return RedirectResponse(url=auth_url, status_code=302)
 
 
-@router.get("/callback", name="auth_callback")
+@router.get(_CALLBACK_PATH, name="auth_callback")
 async def auth_callback(request: Request) -> RedirectResponse:
     """Handle OAuth callback from Keycloak."""
     try:
@@ -164,7 +210,8 @@ async def auth_callback(request: Request) -> RedirectResponse:
         state = request.query_params.get('state')
         session_state = request.session.get('oauth_state')
         
-        if not state or state != session_state:
+        # Constant-time compare so the expected state cannot be probed by timing
+        if not state or not session_state or not secrets.compare_digest(state, session_state):
             raise HTTPException(
                 status_code=400,
                 detail="Invalid state parameter (CSRF protection)"
@@ -181,7 +228,7 @@ async def auth_callback(request: Request) -> RedirectResponse:
             )
         
         # Exchange code for tokens
-        redirect_uri = str(request.url_for('auth_callback'))
+        redirect_uri = _callback_url(request)
         token_data = await exchange_code_for_tokens(code, redirect_uri)
         
         # Extract and store user info
@@ -204,12 +251,8 @@ async def logout(request: Request) -> RedirectResponse:
     """Logout user and redirect to Keycloak logout."""
     request.session.pop('user', None)
     
-    logout_url = (
-        f"{settings.KEYCLOAK_SERVER_URL}/realms/{settings.KEYCLOAK_REALM}"
-        f"/protocol/openid-connect/logout"
-        f"?post_logout_redirect_uri={request.url_for('homepage')}"
-        f"&client_id={settings.KEYCLOAK_CLIENT_ID}"
-    )
+    query = urlencode({"post_logout_redirect_uri": str(request.base_url)})
+    logout_url = f"{_LOGOUT_URL_PREFIX}&{query}"
     
     return RedirectResponse(url=logout_url, status_code=302)
 
@@ -217,28 +260,28 @@ async def logout(request: Request) -> RedirectResponse:
 @router.get("/manager")
 async def manager_dashboard(user: Dict[str, Any] = Depends(require_manager)) -> HTMLResponse:
     """Manager dashboard (requires 'manager' role)."""
-    return HTMLResponse("<h1>Manager Dashboard</h1><p>Welcome, Manager!</p>")
+    return HTMLResponse(_MANAGER_PAGE)
 
 
 @router.get("/ceo")
-async def ceo_dashboard(user: Dict[str, Any] = Depends(require_ceo)) -> Dict[str, Any]:
+async def ceo_dashboard(user: Dict[str, Any] = Depends(require_ceo)) -> Response:
     """
     CEO Dashboard - Display teams and employees from Keycloak groups.
     Requires 'ceo' role.
     """
     try:
-        teams = await get_groups_with_members()
+        summary = await get_teams_summary()
         
-        return {
+        # Returned as a response directly so the (potentially large) team
+        # tree is serialized by orjson without a jsonable_encoder pass
+        return ORJSONResponse({
             "ceo": {
                 "username": user.get('preferred_username') or user.get('email'),
                 "email": user.get('email'),
                 "name": user.get('name'),
             },
-            "teams": teams,
-            "totalTeams": len(teams),
-            "totalEmployees": sum(len(team.get("members", [])) for team in teams),
-        }
+            **summary,
+        })
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -257,7 +300,9 @@ async def api_data(user: Dict[str, Any] = Depends(require_role("manager"))) -> D
 
 
 @router.get("/me")
-async def get_current_user(user: Dict[str, Any] = Depends(require_auth_bearer)) -> Dict[str, Any]:
+async def get_current_user(
+    request: Request, user: Dict[str, Any] = Depends(require_auth_bearer)
+) -> Response:
     """
     Get current authenticated user's details with token information.
     Works with both session cookies and bearer tokens.
@@ -280,10 +325,13 @@ async def get_current_user(user: Dict[str, Any] = Depends(require_auth_bearer))
             "refresh_token": user.get("refresh_token"),
         }
     
-    return wrap_response(
+    return cached_response(
+        request,
         user_data,
         message="User information retrieved successfully",
-        ttl=settings.USER_INFO_CACHE_TTL
+        ttl=settings.USER_INFO_CACHE_TTL,
+        # Session users get their tokens back; never let those be cached
+        store="token_info" not in user_data
     )
 
 
@@ -314,13 +362,13 @@ async def get_token_info(user: Dict[str, Any] = Depends(require_auth_bearer)) ->
 
 
 @router.post("/refresh")
-async def refresh_token(request: Request) -> Dict[str, Any]:
+async def refresh_token(request: Request) -> Response:
     """
     Refresh an expired access token using a refresh token.
     Client secret is kept secure on backend.
     """
     try:
-        body = await request.json()
+        body = orjson.loads(await request.body())
         refresh_token_value = body.get("refresh_token")
         
         if not refresh_token_value:
@@ -329,18 +377,15 @@ async def refresh_token(request: Request) -> Dict[str, Any]:
                 detail="refresh_token required in request body"
             )
         
-        token_url = f"{settings.KEYCLOAK_SERVER_URL}/realms/{settings.KEYCLOAK_REALM}/protocol/openid-connect/token"
-        
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.post(
-                token_url,
-                data={
-                    "grant_type": "refresh_token",
-                    "client_id": settings.KEYCLOAK_CLIENT_ID,
-                    "client_secret": settings.KEYCLOAK_CLIENT_SECRET,
-                    "refresh_token": refresh_token_value,
-                },
-            )
+        response = await get_keycloak_client().post(
+            _TOKEN_URL,
+            data={
+                "grant_type": "refresh_token",
+                "client_id": settings.KEYCLOAK_CLIENT_ID,
+                "client_secret": settings.KEYCLOAK_CLIENT_SECRET,
+                "refresh_token": refresh_token_value,
+            },
+        )
         
         if response.status_code != 200:
             raise HTTPException(
@@ -348,7 +393,8 @@ async def refresh_token(request: Request) -> Dict[str, Any]:
                 detail="Token refresh failed: invalid or expired refresh_token"
             )
         
-        return response.json()
+        # Keycloak's token response is already the JSON we return; pass it through
+        return Response(content=response.content, media_type="application/json")
     
     except HTTPException:
         raise
@@ -360,36 +406,27 @@ async def refresh_token(request: Request) -> Dict[str, Any]:
 
 
 @router.get("/health")
-async def health_check() -> Dict[str, str]:
+async def health_check() -> Response:
     """Health check endpoint for monitoring."""
-    return {"status": "ok"}
+    return Response(content=_HEALTH_BODY, media_type="application/json")
 
 
 @router.get("/cache/info")
-async def cache_info(user: Dict[str, Any] = Depends(require_role("admin"))) -> Dict[str, Any]:
+async def cache_info(
+    request: Request, user: Dict[str, Any] = Depends(require_role("admin"))
+) -> Response:
     """
     Get cache statistics (requires 'admin' role).
     Returns cache configuration and current state.
     """
-    from .jwt_utils import get_cache_info as get_jwt_cache_info
-    from .keycloak_admin import get_cache_info as get_admin_cache_info
-    
     cache_data = {
         "jwt_cache": get_jwt_cache_info(),
         "admin_cache": get_admin_cache_info(),
-        "cache_ttl_config": {
-            "jwks_ttl": settings.JWKS_CACHE_TTL,
-            "jwks_ttl_human": f"{settings.JWKS_CACHE_TTL // 60} minutes",
-            "admin_token_ttl": settings.ADMIN_TOKEN_CACHE_TTL,
-            "admin_token_ttl_human": f"{settings.ADMIN_TOKEN_CACHE_TTL // 60} minutes",
-            "user_info_ttl": settings.USER_INFO_CACHE_TTL,
-            "user_info_ttl_human": f"{settings.USER_INFO_CACHE_TTL // 60} minutes",
-            "group_ttl": settings.GROUP_CACHE_TTL,
-            "group_ttl_human": f"{settings.GROUP_CACHE_TTL // 60} minutes",
-        }
+        "cache_ttl_config": _CACHE_TTL_CONFIG,
     }
     
-    return wrap_response(
+    return cached_response(
+        request,
         cache_data,
         message="Cache information retrieved successfully",
         ttl=60
@@ -402,19 +439,14 @@ async def clear_caches(user: Dict[str, Any] = Depends(require_role("admin"))) ->
     Clear all caches (requires 'admin' role).
     Useful for testing or after Keycloak configuration changes.
     """
-    from .jwt_utils import clear_jwks_cache
-    from .keycloak_admin import clear_admin_token_cache
-    
     clear_jwks_cache()
     clear_admin_token_cache()
+    clear_group_cache()
     
     result = {
         "message": "All caches cleared successfully",
-        "cleared": ["jwks_cache", "admin_token_cache"],
-        "cache_ttl": {
-            "jwks": f"{settings.JWKS_CACHE_TTL}s ({settings.JWKS_CACHE_TTL // 60}min)",
-            "admin_token": f"{settings.ADMIN_TOKEN_CACHE_TTL}s ({settings.ADMIN_TOKEN_CACHE_TTL // 60}min)"
-        }
+        "cleared": ["jwks_cache", "admin_token_cache", "group_cache"],
+        "cache_ttl": _CLEARED_CACHE_TTL,
     }
     
     return wrap_response(
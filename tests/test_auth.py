@@ -0,0 +1,87 @@
+"""
+Tests for role and scope authorization dependencies.
+
+Calls the dependency callables directly with prepared user dicts.
+"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app import auth
+from app.auth import (
+    get_user_from_bearer,
+    require_role,
+    require_scope,
+    resolve_user,
+    user_roles,
+)
+
+
+def test_require_role_with_prebuilt_set():
+    """Test bearer users are checked against their prebuilt roles set."""
+    user = {"roles": ["manager"], "roles_set": frozenset(["manager"])}
+
+    assert require_role("manager")(user) is user
+
+
+def test_require_role_with_session_user():
+    """Test session users without a roles set still pass the check."""
+    user = {"preferred_username": "alice", "roles": ["manager", "ceo"]}
+
+    assert require_role("ceo")(user) is user
+
+
+def test_require_role_forbidden():
+    """Test a missing role raises 403."""
+    user = {"roles": ["manager"], "roles_set": frozenset(["manager"])}
+
+    with pytest.raises(HTTPException) as exc:
+        require_role("admin")(user)
+
+    assert exc.value.status_code == 403
+
+
+def test_require_scope_from_claims():
+    """Test scopes fall back to the raw claim when no set is prebuilt."""
+    user = {"claims": {"scope": "openid read:data"}}
+
+    assert require_scope("read:data")(user) is user
+    with pytest.raises(HTTPException) as exc:
+        require_scope("write:data")(user)
+
+    assert exc.value.status_code == 403
+
+
+def _request_with_auth(value, session=None):
+    headers = [(b"authorization", value.encode())] if value is not None else []
+    return Request({"type": "http", "headers": headers, "session": session or {}})
+
+
+@pytest.mark.parametrize("header", [None, "", "Basic abc", "Bearer", "Bearer    "])
+def test_get_user_from_bearer_ignores_missing_token(header):
+    """Test headers without a bearer token are treated as anonymous."""
+    assert asyncio.run(get_user_from_bearer(_request_with_auth(header))) is None
+
+
+def test_user_roles_prefers_prebuilt_set():
+    """Test prebuilt role sets are reused and lists are converted."""
+    prebuilt = frozenset(["manager"])
+
+    assert user_roles({"roles": ["manager"], "roles_set": prebuilt}) is prebuilt
+    assert user_roles({"roles": ["ceo", "manager"]}) == {"ceo", "manager"}
+    assert user_roles({}) == frozenset()
+
+
+def test_session_user_skips_bearer_validation(monkeypatch):
+    """Test a session user is returned without validating the bearer token."""
+    async def fail_validate(token):
+        raise AssertionError("bearer token should not be validated")
+
+    monkeypatch.setattr(auth, "validate_bearer_token", fail_validate)
+    session_user = {"preferred_username": "alice", "roles": ["manager"]}
+    request = _request_with_auth("Bearer abc", session={"user": session_user})
+
+    assert asyncio.run(resolve_user(request)) is session_user
@@ -4,7 +4,10 @@ Tests for JWKS cache functionality.
 Verifies cache operations, TTL behavior, and cache management utilities.
 """
 
+import asyncio
+
 import pytest
+from app import jwt_utils
 from app.jwt_utils import _jwks_cache, clear_jwks_cache, get_cache_info
 
 
@@ -100,3 +103,26 @@ def test_cache_ttl_configuration():
     
     # Verify maxsize is set
     assert info['maxsize'] > 0
+
+
+def test_concurrent_fetches_are_coalesced(monkeypatch):
+    """Test concurrent cache misses trigger a single JWKS download."""
+    _jwks_cache.clear()
+    calls = []
+    
+    async def fake_download():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {'keys': []}
+    
+    monkeypatch.setattr(jwt_utils, '_download_jwks', fake_download)
+    
+    async def run():
+        return await asyncio.gather(*(jwt_utils._fetch_jwks() for _ in range(10)))
+    
+    results = asyncio.run(run())
+    
+    # Only one download, every caller gets the same JWKS
+    assert len(calls) == 1
+    assert all(r == {'keys': []} for r in results)
+    assert _jwks_cache['jwks'] == {'keys': []}
@@ -0,0 +1,170 @@
+"""
+Tests for bearer token validation.
+
+Signs tokens with a locally generated RSA key and seeds the JWKS cache with
+the matching public key, so no Keycloak instance is required.
+"""
+
+import asyncio
+import base64
+import time
+
+import pytest
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from app import jwt_utils
+from app.config import settings
+from app.exceptions import TokenValidationError
+
+KID = "test-key"
+
+
+def _b64url_uint(value: int) -> str:
+    raw = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+@pytest.fixture(scope="module")
+def rsa_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture
+def jwks(rsa_key):
+    """Seed the JWKS cache with the test public key."""
+    numbers = rsa_key.public_key().public_numbers()
+    data = {
+        "keys": [
+            {
+                "kid": KID,
+                "kty": "RSA",
+                "alg": "RS256",
+                "use": "sig",
+                "n": _b64url_uint(numbers.n),
+                "e": _b64url_uint(numbers.e),
+            }
+        ]
+    }
+    jwt_utils.clear_jwks_cache()
+    jwt_utils._jwks_cache["jwks"] = data
+    yield data
+    jwt_utils.clear_jwks_cache()
+
+
+def _make_token(rsa_key, **overrides) -> str:
+    claims = {
+        "sub": "user-1",
+        "preferred_username": "alice",
+        "iss": f"{settings.KEYCLOAK_SERVER_URL}/realms/{settings.KEYCLOAK_REALM}",
+        "exp": int(time.time()) + 300,
+    }
+    claims.update(overrides)
+    return jwt.encode(claims, rsa_key, algorithm="RS256", headers={"kid": KID})
+
+
+def test_valid_token_returns_claims(rsa_key, jwks):
+    """Test a correctly signed token is accepted."""
+    token = _make_token(rsa_key)
+
+    claims = asyncio.run(jwt_utils.validate_bearer_token(token))
+
+    assert claims["sub"] == "user-1"
+    assert claims["preferred_username"] == "alice"
+
+
+def test_signing_keys_parsed_once_per_jwks(rsa_key, jwks):
+    """Test parsed keys are reused until the JWKS changes."""
+    first = jwt_utils._get_signing_keys(jwks)
+    second = jwt_utils._get_signing_keys(jwks)
+
+    assert KID in first
+    assert first is second
+
+    # A refreshed JWKS triggers a rebuild
+    refreshed = dict(jwks)
+    assert jwt_utils._get_signing_keys(refreshed) is not first
+
+
+def test_expired_token_rejected(rsa_key, jwks):
+    """Test an expired token raises TokenValidationError."""
+    token = _make_token(rsa_key, exp=int(time.time()) - 10)
+
+    with pytest.raises(TokenValidationError):
+        asyncio.run(jwt_utils.validate_bearer_token(token))
+
+
+def test_wrong_issuer_rejected(rsa_key, jwks):
+    """Test a token from another issuer raises TokenValidationError."""
+    token = _make_token(rsa_key, iss="https://evil.example.com/realms/other")
+
+    with pytest.raises(TokenValidationError):
+        asyncio.run(jwt_utils.validate_bearer_token(token))
+
+
+def test_unknown_kid_rejected(rsa_key, jwks):
+    """Test a token signed with a key not in the JWKS is rejected."""
+    token = jwt.encode(
+        {"sub": "user-1"}, rsa_key, algorithm="RS256", headers={"kid": "other"}
+    )
+
+    with pytest.raises(TokenValidationError):
+        asyncio.run(jwt_utils.validate_bearer_token(token))
+
+
+def test_expired_token_rejected_before_jwks_fetch(rsa_key, monkeypatch):
+    """Test expired tokens are rejected without touching the JWKS."""
+    async def fail_fetch():
+        raise AssertionError("JWKS should not be fetched")
+
+    monkeypatch.setattr(jwt_utils, "_fetch_jwks", fail_fetch)
+    token = _make_token(rsa_key, exp=int(time.time()) - 10)
+
+    with pytest.raises(TokenValidationError):
+        asyncio.run(jwt_utils.validate_bearer_token(token))
+
+
+def test_validated_token_is_cached(rsa_key, jwks, monkeypatch):
+    """Test repeat validations of the same token skip verification."""
+    token = _make_token(rsa_key)
+    first = asyncio.run(jwt_utils.validate_bearer_token(token))
+
+    def fail_decode(*args, **kwargs):
+        raise AssertionError("token should be served from cache")
+
+    monkeypatch.setattr(jwt_utils.jwt, "decode", fail_decode)
+    second = asyncio.run(jwt_utils.validate_bearer_token(token))
+
+    assert second == first
+
+
+def test_clear_jwks_cache_drops_validated_tokens(rsa_key, jwks):
+    """Test clearing the JWKS cache also forgets validated tokens."""
+    asyncio.run(jwt_utils.validate_bearer_token(_make_token(rsa_key)))
+    assert len(jwt_utils._token_cache) == 1
+
+    jwt_utils.clear_jwks_cache()
+
+    assert len(jwt_utils._token_cache) == 0
+
+
+def test_decode_jwt_payload(rsa_key):
+    """Test the unverified payload of a well-formed token is decoded."""
+    token = _make_token(rsa_key)
+
+    assert jwt_utils.decode_jwt_payload(token)["preferred_username"] == "alice"
+
+
+def test_decode_jwt_payload_rejects_malformed_token():
+    """Test tokens without a header.payload.signature layout are rejected."""
+    for token in ("no-dots", "header.payload"):
+        with pytest.raises(ValueError):
+            jwt_utils.decode_jwt_payload(token)
+
+
+def test_token_without_exp_reaches_verification(rsa_key, jwks):
+    """Test the unverified pre-check does not reject tokens lacking exp."""
+    claims = {"sub": "user-1", "iss": jwt_utils._ISSUER}
+    token = jwt.encode(claims, rsa_key, algorithm="RS256", headers={"kid": KID})
+
+    assert asyncio.run(jwt_utils.validate_bearer_token(token))["sub"] == "user-1"
@@ -0,0 +1,314 @@
+"""
+Tests for the Keycloak Admin API client.
+
+Serves a small fake realm through httpx.MockTransport installed as the
+shared Keycloak client, so no Keycloak instance is required.
+"""
+
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+import pytest
+
+from app import http_client, keycloak_admin
+from app.config import settings
+
+TOKEN_PATH = f"/realms/{settings.KEYCLOAK_REALM}/protocol/openid-connect/token"
+
+# group id -> (group representation, direct members)
+REALM = {
+    "eng": ({"id": "eng", "name": "Engineering", "path": "/Engineering"}, [{"username": "alice"}]),
+    "backend": ({"id": "backend", "name": "Backend", "path": "/Engineering/Backend"}, [{"username": "bob"}]),
+    "sales": ({"id": "sales", "name": "Sales", "path": "/Sales"}, []),
+}
+CHILDREN = {"eng": ["backend"], "backend": [], "sales": []}
+TOP_LEVEL = ["eng", "sales"]
+
+
+def _brief(group_id):
+    """Keycloak 23+ representation: sub-groups are counted, not embedded."""
+    return {
+        **REALM[group_id][0],
+        "subGroupCount": len(CHILDREN[group_id]),
+        "subGroups": [],
+    }
+
+
+def _tree(group_id):
+    """Pre-23 representation: the whole sub-tree is embedded."""
+    return {**REALM[group_id][0], "subGroups": [_tree(c) for c in CHILDREN[group_id]]}
+
+
+class FakeKeycloak:
+    """Minimal Admin API handler that records every request path."""
+
+    def __init__(self, legacy=False):
+        self.calls = Counter()
+        # Legacy servers predate the /groups/{id}/children endpoint and
+        # embed the whole tree in the top-level /groups listing
+        self.legacy = legacy
+        # Status legacy servers send for GET /groups/{id}/children
+        self.children_status = 404
+        self.token_expires_in = 300
+        # Paths that answer 503 on their next request only
+        self.fail_once = set()
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        self.calls[path] += 1
+        if path in self.fail_once:
+            self.fail_once.discard(path)
+            return httpx.Response(503)
+
+        if path == TOKEN_PATH:
+            return httpx.Response(200, json={"access_token": "admin-token", "expires_in": self.token_expires_in})
+
+        assert request.headers["Authorization"] == "Bearer admin-token"
+        parts = path.split("/groups")[1].strip("/").split("/")
+
+        if parts == [""]:
+            if self.legacy:
+                return httpx.Response(200, json=self._page(request, [_tree(g) for g in TOP_LEVEL]))
+            return httpx.Response(200, json=self._page(request, [_brief(g) for g in TOP_LEVEL]))
+        group_id = parts[0]
+        if group_id not in REALM:
+            return httpx.Response(404)
+        if parts[1:] == ["members"]:
+            return httpx.Response(200, json=self._page(request, REALM[group_id][1]))
+        if parts[1:] == ["children"]:
+            if self.legacy:
+                return httpx.Response(self.children_status)
+            children = [_brief(c) for c in CHILDREN[group_id]]
+            return httpx.Response(200, json=self._page(request, children))
+        if parts[1:] == []:
+            group = dict(REALM[group_id][0])
+            group["subGroups"] = [REALM[c][0] for c in CHILDREN[group_id]]
+            return httpx.Response(200, json=group)
+        return httpx.Response(404)
+
+    @staticmethod
+    def _page(request, items):
+        first = int(request.url.params.get("first", 0))
+        max_results = int(request.url.params.get("max", 100))
+        return items[first:first + max_results]
+
+
+@pytest.fixture
+def keycloak(monkeypatch):
+    """Install a fake Keycloak behind the shared HTTP client."""
+    fake = FakeKeycloak()
+    monkeypatch.setattr(settings, "KEYCLOAK_ADMIN_CLIENT_ID", "admin-cli")
+    monkeypatch.setattr(settings, "KEYCLOAK_ADMIN_CLIENT_SECRET", "secret")
+    monkeypatch.setattr(
+        http_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(fake))
+    )
+    # Each test runs its own event loop; don't share loop-bound primitives
+    monkeypatch.setattr(keycloak_admin, "_token_lock", asyncio.Lock())
+    monkeypatch.setattr(keycloak_admin, "_children_endpoint", None)
+    monkeypatch.setattr(
+        keycloak_admin, "_group_locks", {k: asyncio.Lock() for k in keycloak_admin._group_locks}
+    )
+    keycloak_admin.clear_admin_token_cache()
+    keycloak_admin.clear_group_cache()
+    yield fake
+    keycloak_admin.clear_admin_token_cache()
+    keycloak_admin.clear_group_cache()
+
+
+def test_group_hierarchy(keycloak):
+    """Test the hierarchy mirrors groups, sub-groups and direct members."""
+    hierarchy = asyncio.run(keycloak_admin.get_group_hierarchy())
+
+    assert [g["name"] for g in hierarchy] == ["Engineering", "Sales"]
+    eng = hierarchy[0]
+    assert eng["members"] == [{"username": "alice"}]
+    assert [g["name"] for g in eng["subGroups"]] == ["Backend"]
+    assert eng["subGroups"][0]["members"] == [{"username": "bob"}]
+
+
+def test_groups_with_members(keycloak):
+    """Test the route-facing shape includes sub-group counts."""
+    teams = asyncio.run(keycloak_admin.get_groups_with_members())
+
+    assert [t["subGroupCount"] for t in teams] == [1, 0]
+    assert teams[0]["subGroups"][0]["subGroupCount"] == 0
+    assert teams[1]["members"] == []
+
+
+def test_concurrent_token_requests_are_coalesced(keycloak):
+    """Test concurrent cache misses trigger a single token request."""
+    async def run():
+        return await asyncio.gather(*(keycloak_admin.get_admin_token() for _ in range(10)))
+
+    tokens = asyncio.run(run())
+
+    assert set(tokens) == {"admin-token"}
+    assert keycloak.calls[TOKEN_PATH] == 1
+
+
+def test_each_group_fetched_once_per_build(keycloak):
+    """Test a hierarchy build requests each group resource exactly once."""
+    asyncio.run(keycloak_admin.get_group_hierarchy())
+
+    admin_calls = {p: n for p, n in keycloak.calls.items() if p != TOKEN_PATH}
+    assert admin_calls and set(admin_calls.values()) == {1}
+
+
+def test_listings_are_paginated(keycloak, monkeypatch):
+    """Test list endpoints keep paging until a short page is returned."""
+    monkeypatch.setattr(settings, "KEYCLOAK_ADMIN_PAGE_SIZE", 1)
+
+    groups = asyncio.run(keycloak_admin.get_groups())
+    page = asyncio.run(keycloak_admin.get_groups(first=1, max_results=1))
+
+    assert [g["id"] for g in groups] == TOP_LEVEL
+    assert [g["id"] for g in page] == ["sales"]
+
+
+def test_background_refresher_populates_cache(keycloak):
+    """Test the refresher fetches a token up front and can be cancelled."""
+    async def run():
+        task = asyncio.create_task(keycloak_admin.run_admin_token_refresher())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+
+    assert keycloak_admin._admin_token.value == "admin-token"
+    assert keycloak.calls[TOKEN_PATH] == 1
+
+
+def test_admin_token_expiry_follows_keycloak(keycloak):
+    """Test a token is refetched once it is past its expiry."""
+    asyncio.run(keycloak_admin.get_admin_token())
+    token = keycloak_admin._admin_token
+
+    # Keycloak's expires_in (300s) minus the skew bounds the cache lifetime
+    assert token.expires_at - time.monotonic() <= 300 - keycloak_admin.ADMIN_TOKEN_EXPIRY_SKEW
+
+    keycloak_admin._admin_token = keycloak_admin._AdminToken(token.value, time.monotonic() - 1)
+    asyncio.run(keycloak_admin.get_admin_token())
+
+    assert keycloak.calls[TOKEN_PATH] == 2
+    assert keycloak_admin.get_cache_info()["admin_token_cache"]["current_size"] == 1
+
+
+def test_short_lived_admin_token_is_reused(keycloak):
+    """Test tokens shorter-lived than the expiry skew are still cached."""
+    keycloak.token_expires_in = 8
+
+    asyncio.run(keycloak_admin.get_admin_token())
+    asyncio.run(keycloak_admin.get_admin_token())
+
+    assert keycloak_admin._admin_token.expires_at - time.monotonic() > 0
+    assert keycloak.calls[TOKEN_PATH] == 1
+
+
+def test_hierarchy_is_cached(keycloak):
+    """Test repeat and concurrent hierarchy requests share one build."""
+    async def run():
+        return await asyncio.gather(*(keycloak_admin.get_group_hierarchy() for _ in range(5)))
+
+    results = asyncio.run(run())
+    again = asyncio.run(keycloak_admin.get_group_hierarchy())
+
+    assert all(r is again for r in results)
+    admin_calls = {p: n for p, n in keycloak.calls.items() if p != TOKEN_PATH}
+    assert set(admin_calls.values()) == {1}
+
+    keycloak_admin.clear_group_cache()
+    asyncio.run(keycloak_admin.get_group_hierarchy())
+
+    assert set(n for p, n in keycloak.calls.items() if p != TOKEN_PATH) == {2}
+
+
+def test_subgroups_use_children_endpoint(keycloak):
+    """Test sub-groups come from the children endpoint when available."""
+    asyncio.run(keycloak_admin.get_group_hierarchy())
+
+    assert keycloak_admin._children_endpoint is True
+    assert not any(p.endswith("/groups/eng") for p in keycloak.calls)
+
+
+def test_embedded_subgroups_are_reused(keycloak):
+    """Test trees embedded in the /groups listing need no sub-group lookups."""
+    keycloak.legacy = True
+
+    hierarchy = asyncio.run(keycloak_admin.get_group_hierarchy())
+
+    assert [g["name"] for g in hierarchy[0]["subGroups"]] == ["Backend"]
+    assert all(p.endswith(("/groups", "/members")) for p in keycloak.calls if p != TOKEN_PATH)
+
+
+def test_subgroups_fall_back_on_legacy_keycloak(keycloak):
+    """Test servers without the children endpoint stop being probed."""
+    keycloak.legacy = True
+
+    first = asyncio.run(keycloak_admin.get_subgroups("eng"))
+    second = asyncio.run(keycloak_admin.get_subgroups("backend"))
+
+    assert [g["name"] for g in first] == ["Backend"]
+    assert second == []
+    assert keycloak_admin._children_endpoint is False
+    assert "/backend/children" not in " ".join(keycloak.calls)
+
+
+def test_subgroups_fall_back_on_method_not_allowed(keycloak):
+    """Test a 405 from the children endpoint also selects group lookups."""
+    keycloak.legacy = True
+    keycloak.children_status = 405
+
+    subgroups = asyncio.run(keycloak_admin.get_subgroups("eng"))
+
+    assert [g["name"] for g in subgroups] == ["Backend"]
+    assert keycloak_admin._children_endpoint is False
+
+
+def test_missing_group_does_not_disable_children_endpoint(keycloak):
+    """Test a 404 for a deleted group is raised, not taken as a legacy server."""
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(keycloak_admin.get_subgroups("deleted"))
+
+    assert keycloak_admin._children_endpoint is None
+    asyncio.run(keycloak_admin.get_subgroups("eng"))
+    assert keycloak_admin._children_endpoint is True
+
+
+def test_teams_summary_totals(keycloak):
+    """Test the teams summary carries precomputed totals and is cached."""
+    summary = asyncio.run(keycloak_admin.get_teams_summary())
+
+    assert [t["id"] for t in summary["teams"]] == TOP_LEVEL
+    assert (summary["totalTeams"], summary["totalEmployees"]) == (2, 1)
+    assert asyncio.run(keycloak_admin.get_teams_summary()) is summary
+    assert asyncio.run(keycloak_admin.get_groups_with_members()) is summary["teams"]
+    assert list(keycloak_admin._group_cache) == ["teams_summary"]
+
+
+def test_teams_summary_totals_follow_retried_build(keycloak):
+    """Test totals from a partial build are recomputed on the next call."""
+    keycloak.fail_once.add(f"/admin/realms/{settings.KEYCLOAK_REALM}/groups/eng/members")
+
+    degraded = asyncio.run(keycloak_admin.get_teams_summary())
+    retried = asyncio.run(keycloak_admin.get_teams_summary())
+
+    assert degraded["totalEmployees"] == 0
+    assert retried["totalEmployees"] == 1
+
+
+def test_partial_build_is_not_cached(keycloak):
+    """Test a build with a failed member lookup is retried on the next call."""
+    members_path = f"/admin/realms/{settings.KEYCLOAK_REALM}/groups/eng/members"
+    keycloak.fail_once.add(members_path)
+
+    degraded = asyncio.run(keycloak_admin.get_groups_with_members())
+    retried = asyncio.run(keycloak_admin.get_groups_with_members())
+
+    assert degraded[0]["members"] == []
+    assert retried[0]["members"] == [{"username": "alice"}]
+    assert keycloak.calls[members_path] == 2
+    assert asyncio.run(keycloak_admin.get_groups_with_members()) is retried
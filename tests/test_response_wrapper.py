@@ -0,0 +1,43 @@
+"""
+Tests for the standard response envelope.
+"""
+
+import orjson
+
+from app import response_wrapper
+from app.response_wrapper import APIResponse, ORJSONResponse, wrap_response
+
+
+def test_timestamp_reused_within_a_second(monkeypatch):
+    """Test the formatted timestamp is only rebuilt when the second changes."""
+    now = [1700000000.1]
+    monkeypatch.setattr(response_wrapper.time, "time", lambda: now[0])
+
+    first = wrap_response({})["metadata"]["timestamp"]
+    now[0] = 1700000000.9
+    second = wrap_response({})["metadata"]["timestamp"]
+    now[0] = 1700000001.0
+    third = wrap_response({})["metadata"]["timestamp"]
+
+    assert first is second
+    assert first == "2023-11-14T22:13:20Z"
+    assert third == "2023-11-14T22:13:21Z"
+
+
+def test_ttl_metadata(monkeypatch):
+    """Test TTL metadata expires relative to the response timestamp."""
+    monkeypatch.setattr(response_wrapper.time, "time", lambda: 1700000000.5)
+
+    ttl = wrap_response({}, ttl=300)["metadata"]["ttl"]
+
+    assert ttl["expires_at"] == "2023-11-14T22:18:20Z"
+    assert ttl["human_readable"] == "5 minutes"
+
+
+def test_api_response_uses_orjson():
+    """Test envelopes are rendered by the orjson response class."""
+    response = APIResponse.error("Nope", status_code=404)
+
+    assert isinstance(response, ORJSONResponse)
+    assert response.status_code == 404
+    assert orjson.loads(response.body)["error"]["code"] == "ERR_404"
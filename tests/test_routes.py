@@ -0,0 +1,192 @@
+"""
+Tests for route behaviour that does not need Keycloak.
+
+Uses FastAPI's TestClient without following redirects, overrides auth
+dependencies where a logged-in user is needed, and fakes Keycloak with
+httpx.MockTransport where a handler calls it.
+"""
+
+import asyncio
+import re
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from app import http_client, keycloak_admin, routes
+from app.auth import require_auth_bearer, require_ceo, resolve_user
+from app.main import app
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def test_login_redirect_query_is_encoded(client):
+    """Test the Keycloak auth URL carries properly encoded parameters."""
+    response = client.get("/login", follow_redirects=False)
+
+    assert response.status_code == 302
+    location = urlsplit(response.headers["location"])
+    params = parse_qs(location.query)
+
+    assert location.path.endswith("/protocol/openid-connect/auth")
+    assert params["redirect_uri"] == ["http://testserver/callback"]
+    assert params["scope"] == ["openid email profile"]
+    assert params["response_type"] == ["code"]
+    assert len(params["state"][0]) > 20
+
+
+def test_logout_redirects_back_home(client):
+    """Test logout sends Keycloak an encoded post-logout redirect."""
+    response = client.get("/logout", follow_redirects=False)
+
+    params = parse_qs(urlsplit(response.headers["location"]).query)
+    assert params["post_logout_redirect_uri"] == ["http://testserver/"]
+    assert "client_id" in params
+
+
+def test_me_supports_conditional_requests(client):
+    """Test /me sends an ETag and answers a matching revalidation with 304."""
+    app.dependency_overrides[require_auth_bearer] = lambda: {
+        "sub": "user-1", "preferred_username": "alice", "roles": ["manager"]
+    }
+    try:
+        first = client.get("/me")
+        etag = first.headers["etag"]
+        second = client.get("/me", headers={"If-None-Match": etag})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert first.status_code == 200
+    assert first.json()["data"]["preferred_username"] == "alice"
+    assert first.headers["cache-control"] == "private, no-cache"
+    assert etag.startswith('W/"')
+    assert "Authorization" in first.headers["vary"]
+    assert second.status_code == 304
+    assert second.content == b""
+
+
+def test_me_with_tokens_is_not_stored(client):
+    """Test /me responses carrying session tokens are marked no-store."""
+    app.dependency_overrides[require_auth_bearer] = lambda: {
+        "sub": "user-1", "access_token": "at", "refresh_token": "rt"
+    }
+    try:
+        response = client.get("/me")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.json()["data"]["token_info"]["access_token"] == "at"
+    assert response.headers["cache-control"] == "no-store"
+    assert "etag" not in response.headers
+
+
+def test_health(client):
+    """Test the health probe returns its static JSON body."""
+    response = client.get("/health")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == {"status": "ok"}
+
+
+def test_refresh_passes_keycloak_response_through(client, monkeypatch):
+    """Test /refresh returns Keycloak's token response body unchanged."""
+    body = b'{"access_token":"new","refresh_token":"r2","expires_in":300}'
+
+    def keycloak(request):
+        assert b"grant_type=refresh_token" in request.content
+        return httpx.Response(200, content=body)
+
+    monkeypatch.setattr(
+        http_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(keycloak))
+    )
+
+    response = client.post("/refresh", json={"refresh_token": "r1"})
+
+    assert response.status_code == 200
+    assert response.content == body
+
+
+def test_ceo_dashboard(client, monkeypatch):
+    """Test the CEO dashboard reports teams and employee totals."""
+    teams = [
+        {"id": "eng", "name": "Engineering", "members": [{"username": "alice"}], "subGroups": []},
+        {"id": "sales", "name": "Sales", "members": [], "subGroups": []},
+    ]
+
+    async def fake_build():
+        return teams, True
+
+    monkeypatch.setattr(keycloak_admin, "_build_groups_with_members", fake_build)
+    keycloak_admin.clear_group_cache()
+    app.dependency_overrides[require_ceo] = lambda: {"preferred_username": "ceo"}
+    try:
+        response = client.get("/ceo")
+    finally:
+        app.dependency_overrides.clear()
+        keycloak_admin.clear_group_cache()
+
+    body = response.json()
+    assert response.status_code == 200
+    assert body["ceo"]["username"] == "ceo"
+    assert body["teams"] == teams
+    assert (body["totalTeams"], body["totalEmployees"]) == (2, 1)
+
+
+def test_cache_clear_drops_group_cache(client):
+    """Test /cache/clear also empties the built team hierarchy cache."""
+    keycloak_admin._group_cache["teams_summary"] = {}
+    app.dependency_overrides[resolve_user] = lambda: {"roles": ["admin"]}
+    try:
+        response = client.post("/cache/clear")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert "group_cache" in response.json()["data"]["cleared"]
+    assert len(keycloak_admin._group_cache) == 0
+
+
+@pytest.mark.parametrize(
+    "roles, links",
+    [
+        ([], ["/logout"]),
+        (["manager"], ["/manager", "/logout"]),
+        (["ceo"], ["/ceo", "/logout"]),
+        (["ceo", "manager"], ["/manager", "/ceo", "/logout"]),
+    ],
+)
+def test_homepage_menu_follows_roles(client, roles, links):
+    """Test the dashboard menu lists the links for the user's roles."""
+    user = {"preferred_username": "alice", "roles": roles}
+    request = Request({"type": "http", "headers": [], "session": {"user": user}})
+
+    html = asyncio.run(routes.homepage(request)).body.decode()
+
+    assert re.findall(r'href="([^"]+)"', html) == links
+
+
+def test_homepage_escapes_user_fields(client):
+    """Test user-controlled fields are HTML-escaped on the homepage."""
+    user = {"preferred_username": "<script>x</script>", "roles": ["<b>"]}
+    request = Request({"type": "http", "headers": [], "session": {"user": user}})
+
+    html = asyncio.run(routes.homepage(request)).body.decode()
+
+    assert "<script>" not in html and "<b>" not in html
+    assert "&lt;script&gt;x&lt;/script&gt;" in html
+
+
+def test_callback_rejects_mismatched_state(client):
+    """Test the callback refuses a state that does not match the session."""
+    client.get("/login", follow_redirects=False)
+
+    response = client.get("/callback?state=forged&code=abc", follow_redirects=False)
+
+    assert response.status_code == 400
+    assert "state" in response.json()["detail"]